@@ -0,0 +1,68 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .versions import get_table_version
+
+
+class TokenCache:
+    """Ограниченный по размеру LRU токенов с временем жизни записей.
+
+    Кэш свой у каждого процесса; при отзыве токена или изменении
+    пользователя версия в общем кэше меняется и все процессы
+    сбрасывают свои записи.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Запись и версия, которую нужно передать в set после промаха."""
+        version = get_table_version(Token)
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+                return None, version
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, version
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None, version
+            self.entries.move_to_end(key)
+            return entry[1], version
+
+    def set(self, key, value, version):
+        with self.lock:
+            # Версия сменилась, пока токен читался из БД: он мог быть
+            # отозван, такую запись сохранять нельзя.
+            if version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cached, version = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached, version)
+        user, token = cached
+        return copy.copy(user), token
@@ -0,0 +1,14 @@
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class PersistentFileBasedCache(FileBasedCache):
+    """Файловый кэш без вытеснения.
+
+    FileBasedCache при каждой записи перечисляет весь каталог, чтобы
+    решить, не пора ли удалять записи, и запись стоит O(числа записей).
+    Версиям и отметкам времени вытеснение не нужно, поэтому запись
+    здесь — это один файл.
+    """
+
+    def _cull(self):
+        pass
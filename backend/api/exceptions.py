@@ -5,3 +5,7 @@ class BadRequestException(APIException):
     status_code = 400
     default_detail = 'Запрос некорректен'
     default_code = 'bad_request'
+
+
+class NPlusOneError(Exception):
+    """Один и тот же запрос к БД повторяется в цикле."""
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+
+from recipes.models import Ingredient, Recipe, Tag
+
+from .versions import get_table_changed_at, get_table_version
+
+FEED_PARAMS = ('page', 'limit', 'tags', 'author')
+FEED_MODELS = (Recipe, Tag, Ingredient)
+
+
+def get_feed_key(request):
+    """Ключ кэша ленты для анонимного запроса или None, если кэш неприменим.
+
+    Параметры нормализуются: теги сортируются, порядок параметров в
+    строке запроса не влияет на ключ.
+    """
+    if request.user.is_authenticated:
+        return None
+    if request.accepted_renderer.format != 'json':
+        return None
+    params = request.query_params
+    if set(params) - {*FEED_PARAMS, api_settings.URL_FORMAT_OVERRIDE}:
+        return None
+    normalized = {
+        'page': params.get('page', '1'),
+        'limit': params.get('limit', ''),
+        'tags': sorted(set(params.getlist('tags'))),
+        'author': params.get('author', ''),
+    }
+    digest = hashlib.sha1(
+        json.dumps(normalized, sort_keys=True).encode()
+    ).hexdigest()
+    return f'recipe_feed:{digest}'
+
+
+def build_feed_entry(generation, build):
+    # Время изменения берётся до сборки: правка во время сборки сменит
+    # поколение, и запись не будет считаться свежей.
+    changed_at = max(get_table_changed_at(model) for model in FEED_MODELS)
+    return {
+        'generation': generation,
+        'changed_at': changed_at,
+        'fresh_until': time.time() + settings.FEED_CACHE_TTL,
+        'data': build(),
+    }
+
+
+def get_cached_feed(key, build):
+    """Запись ленты из кэша с защитой от одновременной пересборки.
+
+    Запись считается свежей, пока не изменилось поколение рецептов и не
+    истёк FEED_CACHE_TTL. Пересобирает устаревшую запись только тот, кто
+    взял блокировку; остальные отдают старое значение. Вместе с данными
+    возвращаются поколение и время изменения, из которых строятся ETag и
+    Last-Modified без запросов к БД.
+    """
+    generation = ':'.join(
+        get_table_version(model) for model in FEED_MODELS
+    )
+    entry = cache.get(key)
+    if (entry is not None and entry['generation'] == generation
+            and entry['fresh_until'] > time.time()):
+        return entry
+    if not cache.add(f'{key}:lock', 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+        if entry is not None:
+            return entry
+        return build_feed_entry(generation, build)
+    try:
+        entry = build_feed_entry(generation, build)
+        cache.set(key, entry, settings.FEED_CACHE_STALE_TIMEOUT)
+    finally:
+        cache.delete(f'{key}:lock')
+    return entry
@@ -1,8 +1,10 @@
-from django.db.models import Subquery, OuterRef, Prefetch
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 import django_filters
 
-from recipes.models import Recipe, Ingredient, RecipeFavorite, ShoppingCart
+from recipes.models import Recipe, Ingredient
 from django.contrib.auth import get_user_model
+from .search import search_recipes
 from .utils import list_related_recipes
 
 User = get_user_model()
@@ -19,22 +21,20 @@ class RecipeFilter(django_filters.FilterSet):
     is_in_shopping_cart = django_filters.NumberFilter(
         method='get_is_in_shopping_cart'
     )
+    search = django_filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
 
     def get_is_favorited(self, queryset, name, value):
-        return list_related_recipes(
-            self, queryset, value,
-            RecipeFavorite, 'favorited'
-        )
+        return list_related_recipes(self, queryset, value, 'favorited')
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        return list_related_recipes(
-            self, queryset, value,
-            ShoppingCart, 'buyers'
-        )
+        return list_related_recipes(self, queryset, value, 'buyers')
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
 
 class IngredientFilter(django_filters.FilterSet):
@@ -54,20 +54,21 @@ class UserRecipeFilter(django_filters.FilterSet):
         model = User
         fields = '__all__'
 
+    def filter_queryset(self, queryset):
+        if self.form.cleaned_data.get('recipes_limit') is None:
+            queryset = queryset.prefetch_related('recipes')
+        return super().filter_queryset(queryset)
+
     def get_recipes_limit(self, queryset, name, value):
-        recipe_sq = Subquery(
+        limited_recipes = (
             Recipe.objects
-            .filter(author__id=OuterRef('id'))
-            .values('id')[:value]
-        )
-        user_sq = Subquery(
-            queryset
-            .filter(recipes__id__in=recipe_sq)
-            .values_list('recipes__id')
+            .annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=F('pub_date').desc()
+            ))
+            .filter(row_number__lte=value)
         )
         return queryset.prefetch_related(
-            Prefetch(
-                'recipes',
-                queryset=Recipe.objects.filter(id__in=user_sq)
-            )
+            Prefetch('recipes', queryset=limited_recipes)
         )
@@ -0,0 +1,57 @@
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from .versions import get_table_version
+
+
+class IngredientIndex:
+    """Sorted in-memory index of ingredient names for autocomplete"""
+
+    def __init__(self):
+        self._data = (None, [], [])
+
+    def _load(self, version):
+        rows = sorted(
+            (
+                (name.lower(), {
+                    'id': id,
+                    'name': name,
+                    'measurement_unit': measurement_unit
+                })
+                for id, name, measurement_unit
+                in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+            ),
+            key=lambda row: (row[0], row[1]['id'])
+        )
+        self._data = (
+            version,
+            [key for key, _ in rows],
+            [ingredient for _, ingredient in rows]
+        )
+        return self._data
+
+    def search(self, name):
+        version = get_table_version(Ingredient)
+        data = self._data
+        if data[0] != version:
+            data = self._load(version)
+        _, keys, ingredients = data
+        query = name.lower()
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        substring_matches = [
+            ingredient
+            for position, (key, ingredient) in enumerate(
+                zip(keys, ingredients)
+            )
+            if query in key and not start <= position < end
+        ]
+        return ingredients[start:end] + substring_matches
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,131 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Число обработанных запросов.'
+    ),
+    'foodgram_request_errors_total': (
+        'counter', 'Число запросов, завершившихся ошибкой сервера.'
+    ),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.'
+    ),
+    'foodgram_request_queries': (
+        'histogram', 'Число запросов к БД на один запрос.'
+    ),
+}
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+class QueryCount:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsStore:
+    """Счётчики процесса, сбрасываемые в свой файл в общем каталоге.
+
+    Каждый воркер gunicorn пишет только в файл со своим pid, поэтому
+    блокировки между процессами не нужны; при чтении файлы суммируются.
+    """
+
+    def __init__(self, directory, flush_interval):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.samples = defaultdict(float)
+        self.lock = threading.Lock()
+        self.flushed_at = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = f'{name}{{{format_labels(labels)}}}'
+        self.samples[key] += value
+
+    def observe(self, name, labels, value, buckets):
+        for bucket in buckets:
+            self.inc(
+                f'{name}_bucket', {**labels, 'le': bucket}, value <= bucket
+            )
+        self.inc(f'{name}_bucket', {**labels, 'le': '+Inf'})
+        self.inc(f'{name}_sum', labels, value)
+        self.inc(f'{name}_count', labels)
+
+    def observe_request(self, view, method, status, duration, queries):
+        with self.lock:
+            labels = {'view': view, 'method': method}
+            self.inc('foodgram_requests_total', {**labels, 'status': status})
+            if status >= 500:
+                self.inc('foodgram_request_errors_total', labels)
+            self.observe(
+                'foodgram_request_duration_seconds', labels, duration,
+                DURATION_BUCKETS
+            )
+            self.observe(
+                'foodgram_request_queries', labels, queries, QUERY_BUCKETS
+            )
+            if time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        if not self.samples:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.samples))
+        os.replace(temporary, path)
+        self.flushed_at = time.monotonic()
+
+    def collect(self):
+        with self.lock:
+            self.flush()
+        samples = defaultdict(float)
+        for path in self.directory.glob('*.json'):
+            try:
+                stored = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for key, value in stored.items():
+                samples[key] += value
+        return samples
+
+    def render(self):
+        grouped = defaultdict(list)
+        for key, value in self.collect().items():
+            name = key.split('{', 1)[0]
+            for suffix in ('_bucket', '_sum', '_count'):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                    name = name[:-len(suffix)]
+            grouped[name].append(f'{key} {value!r}')
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(grouped.get(name, ()))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsStore(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+atexit.register(metrics.flush)
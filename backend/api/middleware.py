@@ -0,0 +1,125 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from .metrics import QueryCount, metrics
+from .nplusone import detect_n_plus_one
+from .timing import (
+    RequestTiming,
+    current_timing,
+    get_view_label,
+    wrap_queries
+)
+
+logger = logging.getLogger('api.timing')
+
+
+class ServerTimingMiddleware:
+    """Выборочный замер SQL, сериализации и рендеринга запроса.
+
+    Замер пишется в лог для всех выбранных запросов, а заголовок
+    Server-Timing отдаётся только сотрудникам.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            with wrap_queries(timing):
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        timing.finish()
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = timing.header()
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, timing
+            )
+        else:
+            self.log(request, response, timing)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = current_timing.get()
+        if timing is not None:
+            timing.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = current_timing.get()
+        if timing is None:
+            return response
+        if hasattr(timing, 'view_start'):
+            timing.add('view', timing.view_start)
+        render_start = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: timing.add('render', render_start)
+        )
+        return response
+
+    def stream(self, request, response, content, timing):
+        """Досылает запись в лог после отдачи потокового ответа."""
+        start = time.perf_counter()
+        try:
+            with wrap_queries(timing):
+                yield from content
+        finally:
+            timing.add('stream', start)
+            self.log(request, response, timing)
+
+    def log(self, request, response, timing):
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': get_view_label(request),
+            'status': response.status_code,
+        }
+        fields.update(timing.log_fields())
+        logger.info(
+            ' '.join(f'{key}={value}' for key, value in fields.items()),
+            extra={'timing': fields}
+        )
+
+
+class NPlusOneMiddleware:
+    """Поиск повторов одного запроса к БД в пределах HTTP-запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_n_plus_one(request.path) as counter:
+            request.query_counter = counter
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_counter.label = get_view_label(request)
+
+
+class MetricsMiddleware:
+    """Счётчики и гистограммы запросов для /api/metrics/."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCount()
+        start = time.perf_counter()
+        with wrap_queries(queries):
+            response = self.get_response(request)
+        metrics.observe_request(
+            get_view_label(request),
+            request.method,
+            response.status_code,
+            time.perf_counter() - start,
+            queries.count
+        )
+        return response
@@ -0,0 +1,82 @@
+import logging
+import re
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .exceptions import NPlusOneError
+from .timing import wrap_queries
+
+logger = logging.getLogger('api.nplusone')
+
+STACK_DEPTH = 6
+NORMALIZERS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize_sql(sql):
+    """Шаблон запроса: литералы и списки IN заменены заглушками."""
+    for pattern, replacement in NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def get_stack_excerpt():
+    """Последние кадры стека из кода проекта, без библиотек."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+    ]
+    return ''.join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+class QueryTemplateCounter:
+    """Считает повторы одного шаблона SQL в пределах запроса."""
+
+    def __init__(self, label, threshold=None, raise_error=None):
+        self.label = label
+        self.threshold = (
+            settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        )
+        self.raise_error = (
+            settings.NPLUSONE_RAISE if raise_error is None else raise_error
+        )
+        self.counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        template = normalize_sql(sql)
+        self.counts[template] += 1
+        if self.counts[template] == self.threshold + 1:
+            self.report(template)
+        return execute(sql, params, many, context)
+
+    def report(self, template):
+        message = (
+            f'{self.label}: запрос выполнен больше {self.threshold} раз: '
+            f'{template}'
+        )
+        if self.raise_error:
+            raise NPlusOneError(message)
+        logger.warning('%s\n%s', message, get_stack_excerpt())
+
+    @property
+    def repeated(self):
+        return {
+            template: count for template, count in self.counts.items()
+            if count > self.threshold
+        }
+
+
+@contextmanager
+def detect_n_plus_one(label='', threshold=None, raise_error=None):
+    counter = QueryTemplateCounter(label, threshold, raise_error)
+    with wrap_queries(counter):
+        yield counter
@@ -1,5 +1,119 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class RecipePagination(CustomPageNumberPagination):
+    cursor_query_param = 'cursor'
+    default_ordering = ('-pub_date', 'name')
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        aliases = [f'cursor_{index}' for index in range(len(ordering))]
+        queryset = queryset.annotate(**{
+            alias: F(field.lstrip('-'))
+            for alias, field in zip(aliases, ordering)
+        }).order_by(*(
+            '-' + alias if field.startswith('-') else alias
+            for alias, field in zip(aliases, ordering)
+        ))
+        position = self.decode_cursor(request, [
+            queryset.query.annotations[alias].output_field
+            for alias in aliases
+        ])
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(aliases, ordering, position)
+            )
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        self.position = (
+            [getattr(self.page[-1], alias) for alias in aliases]
+            if self.page else None
+        )
+        return self.page
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or self.default_ordering)
+        if self.tiebreaker not in ordering:
+            ordering.append(self.tiebreaker)
+        return ordering
+
+    def get_keyset_filter(self, aliases, ordering, position):
+        keyset = Q()
+        for index, (alias, field) in enumerate(zip(aliases, ordering)):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{alias}__{lookup}': position[index]})
+            for previous in range(index):
+                step &= Q(**{aliases[previous]: position[previous]})
+            keyset |= step
+        return keyset
+
+    def decode_cursor(self, request, fields):
+        """Позиция из курсора, приведённая к типам полей сортировки."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                field.to_python(value)
+                for field, value in zip(fields, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        data = json.dumps([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.position)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,59 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartData(dict):
+    """Form data that merges uploaded files by their single value
+
+    DRF builds request.data as data.copy().update(files); a plain dict
+    would take the raw value lists out of the files MultiValueDict.
+    """
+
+    def copy(self):
+        return MultiPartData(self)
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'lists'):
+            other = other.items()
+        super().update(other, **kwargs)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """Multipart parser that decodes JSON-encoded form fields
+
+    Nested values such as ingredients and tags are sent as JSON strings
+    next to the image file part. Only fields listed in json_fields are
+    decoded and they are always lists: each submitted value is decoded
+    and JSON arrays are flattened, so tags=1, tags=1&tags=2 and
+    tags=[1, 2] are all accepted. Free text such as name and text is
+    passed through as is.
+    """
+
+    json_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        data = MultiPartData()
+        for key, values in result.data.lists():
+            if key in self.json_fields:
+                data[key] = self.decode_list(key, values)
+            else:
+                data[key] = values if len(values) > 1 else values[0]
+        # Файлы остаются в files, чтобы Django закрыл временные файлы
+        # загрузки по окончании запроса.
+        return DataAndFiles(data, result.files)
+
+    def decode_list(self, key, values):
+        items = []
+        for value in values:
+            try:
+                value = json.loads(value)
+            except ValueError as exc:
+                raise ParseError(f'JSON parse error in {key} - {exc}')
+            if isinstance(value, list):
+                items.extend(value)
+            else:
+                items.append(value)
+        return items
@@ -0,0 +1,62 @@
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+
+from recipes.models import Ingredient, Tag
+
+from .versions import get_table_version
+
+# Поля, зависящие от пользователя: в кэше хранятся пустыми и
+# заполняются из аннотаций запроса.
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+AUTHOR_USER_FIELDS = ('is_subscribed',)
+
+recipe_cache = caches['recipes']
+
+
+def get_recipe_keys(recipes):
+    """Ключи представлений рецептов.
+
+    updated_at сдвигается при любом изменении рецепта, его тегов или
+    автора, версии справочников — при изменении тегов и ингредиентов.
+    """
+    dictionaries = '{}:{}'.format(
+        get_table_version(Tag), get_table_version(Ingredient)
+    )
+    return {
+        recipe.id: 'recipe:{}:{}:{}'.format(
+            recipe.id, recipe.updated_at.timestamp(), dictionaries
+        )
+        for recipe in recipes
+    }
+
+
+def get_recipe_representations(recipes, serialize, lookups):
+    """Представления рецептов из кэша с наложением полей пользователя.
+
+    Рецепты должны быть аннотированы is_favorited, is_in_shopping_cart и
+    is_author_subscribed. Связанные объекты подгружаются по lookups
+    только для рецептов, которых нет в кэше.
+    """
+    keys = get_recipe_keys(recipes)
+    cached = recipe_cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if missing:
+        prefetch_related_objects(missing, *lookups)
+        fresh = {}
+        for recipe, data in zip(missing, serialize(missing)):
+            data = dict(data, author=dict(data['author']))
+            data.update(dict.fromkeys(USER_FIELDS))
+            data['author'].update(dict.fromkeys(AUTHOR_USER_FIELDS))
+            fresh[keys[recipe.id]] = data
+        recipe_cache.set_many(fresh)
+        cached.update(fresh)
+    representations = []
+    for recipe in recipes:
+        data = dict(cached[keys[recipe.id]])
+        data['author'] = dict(
+            data['author'], is_subscribed=recipe.is_author_subscribed
+        )
+        data['is_favorited'] = recipe.is_favorited
+        data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+        representations.append(data)
+    return representations
@@ -0,0 +1,38 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+
+FTS_MATCH = (
+    'SELECT rowid FROM recipes_recipe_fts WHERE recipes_recipe_fts MATCH %s'
+)
+FTS_RANK = (
+    '(SELECT -bm25(recipes_recipe_fts, 10.0, 1.0) FROM recipes_recipe_fts '
+    'WHERE recipes_recipe_fts MATCH %s AND rowid = recipes_recipe.id)'
+)
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию с ранжированием.
+
+    На PostgreSQL используется tsvector с русским стеммингом, на SQLite
+    таблица FTS5 с поиском по префиксам слов.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+    else:
+        terms = re.findall(r'\w+', value)
+        if not terms:
+            return queryset.none()
+        match = ' '.join(f'"{term}"*' for term in terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(FTS_MATCH, [match])
+        ).annotate(search_rank=RawSQL(FTS_RANK, [match]))
+    return queryset.order_by('-search_rank', *Recipe._meta.ordering)
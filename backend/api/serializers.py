@@ -1,22 +1,30 @@
 import base64
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import (
     UserSerializer as BaseUserSerializer,
     UserCreateSerializer as BaseUserCreateSerializer
 )
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
 from rest_framework.serializers import (
     ModelSerializer,
     PrimaryKeyRelatedField,
-    ImageField,
+    FileField,
     IntegerField,
     SerializerMethodField,
     CurrentUserDefault,
     ReadOnlyField,
     ValidationError
 )
+from recipes.constants import IMAGE_FORMATS
+from recipes.images import get_stored_image, schedule_image_processing
 from recipes.models import (
     Recipe,
     Ingredient,
@@ -27,6 +35,8 @@ from recipes.models import (
 )
 from users.models import Follow
 
+from .utils import shopping_list_changes, update_shopping_list
+
 User = get_user_model()
 
 
@@ -39,6 +49,8 @@ class UserSerializer(BaseUserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user.id
         return Follow.objects.filter(user=user, author=obj).exists()
 
@@ -67,13 +79,74 @@ class IngredientSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class Base64ImageField(ImageField):
+class Base64ImageField(FileField):
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'too_large': 'Размер изображения превышает {max_size} МБ.',
+    }
+    signatures = {
+        b'\x89PNG\r\n\x1a\n': 'png',
+        b'\xff\xd8\xff': 'jpg',
+        b'GIF87a': 'gif',
+        b'GIF89a': 'gif',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
+            if len(imgstr) * 3 // 4 > settings.MAX_UPLOAD_SIZE:
+                self.fail('too_large',
+                          max_size=settings.MAX_UPLOAD_SIZE // (1024 * 1024))
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        file = super().to_internal_value(data)
+        header = file.read(12)
+        file.seek(0)
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return get_stored_image(file, 'webp')
+        for signature, extension in self.signatures.items():
+            if header.startswith(signature):
+                return get_stored_image(file, extension)
+        self.fail('invalid_image')
+
+
+class BulkManyRelatedField(ManyRelatedField):
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_value_bulk(data)
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value_bulk(self, data):
+        queryset = self.get_queryset()
+        pk = queryset.model._meta.pk
+        pk_values = []
+        for item in data:
+            try:
+                pk_values.append(pk.to_python(
+                    self.pk_field.to_internal_value(item)
+                    if self.pk_field else item
+                ))
+            except (TypeError, ValueError, DjangoValidationError):
+                self.fail('incorrect_type', data_type=type(item).__name__)
+        objects = queryset.in_bulk(pk_values)
+        for pk_value in pk_values:
+            if pk_value not in objects:
+                self.fail('does_not_exist', pk_value=pk_value)
+        return [objects[pk_value] for pk_value in pk_values]
 
 
 class RecipeIngredientSerializer(ModelSerializer):
@@ -94,6 +167,7 @@ class RecipeSerializer(ModelSerializer):
     ingredients = RecipeIngredientSerializer(source='contents', many=True)
     tags = TagSerializer(many=True)
     image = SerializerMethodField('get_image_url', read_only=True)
+    image_srcset = SerializerMethodField('get_image_srcset', read_only=True)
     is_favorited = SerializerMethodField('get_is_favorited')
     is_in_shopping_cart = SerializerMethodField('get_is_in_shopping_cart')
 
@@ -101,7 +175,9 @@ class RecipeSerializer(ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_srcset', 'image_width',
+                  'image_height', 'image_placeholder', 'text',
+                  'cooking_time')
 
     def __init__(self, *args, **kwargs):
         fields = kwargs.pop('fields', None)
@@ -117,23 +193,35 @@ class RecipeSerializer(ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_srcset(self, obj):
+        variants = {
+            variant['width']: variant
+            for variant in obj.image_variants.values()
+        }
+        return {
+            extension: ', '.join(
+                '{} {}w'.format(default_storage.url(variant[extension]), width)
+                for width, variant in variants.items()
+            )
+            for extension, _ in IMAGE_FORMATS
+            if obj.image_variants
+        }
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user.id
         return RecipeFavorite.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user.id
         return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
 
 
 class CreateRecipeIngredientSerializer(ModelSerializer):
-    id = PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        required=True,
-        error_messages={
-            'does_not_exist': 'Ингредиент не найден!',
-        }
-    )
+    id = IntegerField(required=True)
     amount = IntegerField(
         required=True,
         write_only=True,
@@ -157,7 +245,7 @@ class CreateRecipeSerializer(ModelSerializer):
         required=True
     )
     image = Base64ImageField(max_length=None, use_url=True)
-    tags = PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True,
         required=True,
@@ -172,6 +260,14 @@ class CreateRecipeSerializer(ModelSerializer):
                   'name', 'image', 'text', 'cooking_time')
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            Prefetch(
+                'contents',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            'tags'
+        )
         serializer = RecipeSerializer(
             instance,
             context=self.context
@@ -207,31 +303,89 @@ class CreateRecipeSerializer(ModelSerializer):
         if len(id_list) != len(set(id_list)):
             raise ValidationError('Ингредиенты рецепта '
                                   'должны быть уникальны.')
+        found = Ingredient.objects.in_bulk(id_list)
+        errors = [
+            {} if ingredient_id in found
+            else {'id': ['Ингредиент не найден!']}
+            for ingredient_id in id_list
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+        for ingredient in value:
+            ingredient['id'] = found[ingredient['id']]
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for ingredient in ingredients:
-            recipe.contents.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
                 ingredient=ingredient['id'],
                 amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        )
         recipe.tags.set(tags)
+        schedule_image_processing(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
         tags = validated_data.pop('tags')
-        instance.tags.clear()
-        for ingredient in ingredients:
-            instance.ingredients.add(
-                ingredient['id'],
-                through_defaults={'amount': ingredient['amount']}
+        contents = {
+            content.ingredient_id: content
+            for content in instance.contents.all()
+        }
+        old_contents = [
+            (ingredient_id, content.amount)
+            for ingredient_id, content in contents.items()
+        ]
+        new_contents = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed_contents = []
+        for ingredient_id, content in contents.items():
+            amount = new_contents.get(ingredient_id)
+            if amount is not None and amount != content.amount:
+                content.amount = amount
+                changed_contents.append(content)
+        RecipeIngredient.objects.filter(
+            pk__in=[
+                content.pk for ingredient_id, content in contents.items()
+                if ingredient_id not in new_contents
+            ]
+        ).delete()
+        RecipeIngredient.objects.bulk_update(changed_contents, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=instance,
+                ingredient_id=ingredient_id,
+                amount=amount
             )
+            for ingredient_id, amount in new_contents.items()
+            if ingredient_id not in contents
+        )
         instance.tags.set(tags)
+        update_shopping_list(shopping_list_changes(
+            instance.buyers.values_list('user_id', flat=True),
+            old_contents=old_contents,
+            new_contents=new_contents.items()
+        ))
+        if validated_data.get('image') == instance.image.name:
+            validated_data.pop('image')
+        if 'image' in validated_data:
+            schedule_image_processing(instance.id)
+            validated_data.update(
+                image_width=None,
+                image_height=None,
+                image_placeholder='',
+                image_variants={}
+            )
         super().update(instance, validated_data)
         return instance
 
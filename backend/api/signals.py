@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeFavorite,
+    ShoppingCart,
+    Tag
+)
+from users.models import Follow
+
+from .utils import change_shopping_list
+from .versions import (
+    bump_table_version,
+    forget_user_state,
+    touch_user_state
+)
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def dictionary_changed(sender, **kwargs):
+    bump_table_version(sender)
+
+
+@receiver(post_delete, sender=Token)
+@receiver((post_save, post_delete), sender=User)
+def credentials_changed(sender, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login, кэш токенов не трогаем.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_table_version(Token))
+
+
+def recipes_changed(recipe_ids, touch=True):
+    """Сдвигает updated_at рецептов и поколение ленты после коммита."""
+    recipe_ids = list(recipe_ids)
+    if touch:
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+    transaction.on_commit(lambda: bump_table_version(Recipe))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # updated_at самого рецепта уже выставлен auto_now. Состав рецепта
+    # меняется только вместе с сохранением рецепта (сериализатор, админка),
+    # поэтому отдельного обработчика на каждую строку RecipeIngredient нет:
+    # он давал UPDATE на каждую строку и отключал быстрое удаление.
+    recipes_changed([instance.id], touch=False)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipes_changed([instance.id])
+    elif pk_set is not None:
+        recipes_changed(pk_set)
+    else:
+        recipes_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and set(update_fields) == {
+        'last_login'
+    }:
+        return
+    recipes_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    user_id = instance.id
+    transaction.on_commit(lambda: forget_user_state(user_id))
+
+
+@receiver((post_save, post_delete), sender=RecipeFavorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def user_state_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_user_state(instance.user_id))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        change_shopping_list(instance, True)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    # pre_delete срабатывает и при каскадном удалении рецепта или
+    # пользователя, пока состав рецепта ещё не удалён.
+    change_shopping_list(instance, False)
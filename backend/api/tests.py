@@ -0,0 +1,329 @@
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeFavorite,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from users.models import Follow
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES_COUNT = 30
+INGREDIENTS_PER_RECIPE = 3
+# Наибольшее число запросов к БД на действие. Страница из 24 рецептов и
+# рецепт из 30 ингредиентов должны укладываться в те же бюджеты, что и
+# одна запись: рост означает N+1 или лишнюю выборку.
+QUERY_BUDGETS = {
+    'recipes.list': 9,
+    'recipes.list.cached': 5,
+    'recipes.list.anonymous': 6,
+    'recipes.list.anonymous.cached': 0,
+    'recipes.retrieve': 7,
+    'recipes.retrieve.cached': 3,
+    'recipes.retrieve.anonymous': 6,
+    'recipes.create': 16,
+    'recipes.partial_update': 18,
+    'recipes.destroy': 12,
+}
+
+
+def clear_caches():
+    """Сбрасывает кэши представлений, ленты и версий между замерами."""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, NPLUSONE_RAISE=True)
+class RecipeAPITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Тестов', password='password'
+        )
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Тестов', password='password'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.author_token = Token.objects.create(user=cls.author)
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}')
+            for index in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(60)
+        )
+        cls.recipes = []
+        for index in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.author if index % 2 else cls.user,
+                name=f'Рецепт {index}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/test.png'
+            )
+            recipe.tags.set(cls.tags[:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[index + offset],
+                    amount=offset + 1
+                )
+                for offset in range(INGREDIENTS_PER_RECIPE)
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            RecipeFavorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        clear_caches()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+
+class RecipeListQueryCountTest(RecipeAPITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    limits = (1, 6, 24)
+
+    def assertQueriesFlat(self, client, params=None):
+        expected = None
+        for limit in self.limits:
+            clear_caches()
+            if expected is None:
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(
+                        '/api/recipes/', {**(params or {}), 'limit': limit}
+                    )
+                expected = len(queries)
+            else:
+                with self.assertNumQueries(expected):
+                    response = client.get(
+                        '/api/recipes/', {**(params or {}), 'limit': limit}
+                    )
+            self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_list(self):
+        response = self.assertQueriesFlat(self.anonymous)
+        self.assertEqual(len(response.data['results']), self.limits[-1])
+
+    def test_authenticated_list(self):
+        response = self.assertQueriesFlat(self.client)
+        self.assertEqual(len(response.data['results']), self.limits[-1])
+
+    def test_favorited_and_shopping_cart_filters(self):
+        self.assertQueriesFlat(self.client, {'is_favorited': 1})
+        self.assertQueriesFlat(self.client, {'is_in_shopping_cart': 1})
+
+    def test_flags_are_annotated_for_user(self):
+        favorited = {recipe.id for recipe in self.recipes[::2]}
+        in_cart = {recipe.id for recipe in self.recipes[::3]}
+        response = self.client.get('/api/recipes/', {'limit': RECIPES_COUNT})
+        self.assertEqual(len(response.data['results']), RECIPES_COUNT)
+        for recipe in response.data['results']:
+            self.assertEqual(
+                recipe['is_favorited'], recipe['id'] in favorited
+            )
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in in_cart
+            )
+
+    def test_flags_are_false_for_anonymous(self):
+        response = self.anonymous.get(
+            '/api/recipes/', {'limit': RECIPES_COUNT}
+        )
+        for recipe in response.data['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['is_in_shopping_cart'])
+
+    def test_anonymous_favorited_filter_is_empty(self):
+        for param in ('is_favorited', 'is_in_shopping_cart'):
+            response = self.anonymous.get('/api/recipes/', {param: 1})
+            self.assertEqual(response.data['count'], 0)
+
+
+class RecipeQueryBudgetTest(RecipeAPITestCase):
+    """Бюджеты запросов для чтения и записи рецептов."""
+
+    def assertWithinBudget(self, action, client, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        self.assertLessEqual(
+            len(queries), QUERY_BUDGETS[action],
+            '{}: {} запросов при бюджете {}:\n{}'.format(
+                action, len(queries), QUERY_BUDGETS[action],
+                '\n'.join(query['sql'] for query in queries)
+            )
+        )
+        return response
+
+    def get_payload(self, ingredients):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_list(self):
+        for action in ('recipes.list', 'recipes.list.cached'):
+            self.assertWithinBudget(
+                action, self.client, 'get', '/api/recipes/?limit=24'
+            )
+
+    def test_anonymous_list(self):
+        for action in ('recipes.list.anonymous',
+                       'recipes.list.anonymous.cached'):
+            self.assertWithinBudget(
+                action, self.anonymous, 'get', '/api/recipes/?limit=24'
+            )
+
+    def test_retrieve(self):
+        url = f'/api/recipes/{self.recipes[1].id}/'
+        for action in ('recipes.retrieve', 'recipes.retrieve.cached'):
+            self.assertWithinBudget(action, self.client, 'get', url)
+        clear_caches()
+        self.assertWithinBudget(
+            'recipes.retrieve.anonymous', self.anonymous, 'get', url
+        )
+
+    def test_write(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.author_token}'
+        )
+        response = self.assertWithinBudget(
+            'recipes.create', self.client, 'post', '/api/recipes/',
+            data=self.get_payload(self.ingredients[:30]), format='json'
+        )
+        self.assertEqual(len(response.data['ingredients']), 30)
+        url = f'/api/recipes/{response.data["id"]}/'
+        response = self.assertWithinBudget(
+            'recipes.partial_update', self.client, 'patch', url,
+            data=self.get_payload(self.ingredients[25:35]), format='json'
+        )
+        self.assertEqual(len(response.data['ingredients']), 10)
+        self.assertWithinBudget(
+            'recipes.destroy', self.client, 'delete', url
+        )
+
+
+class RecipeCursorPaginationTest(RecipeAPITestCase):
+    """Постраничный вывод рецептов по курсору."""
+
+    @staticmethod
+    def encode(position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def test_cursor_walks_all_recipes(self):
+        ids = []
+        response = self.anonymous.get(
+            '/api/recipes/', {'cursor': '', 'limit': 7}
+        )
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.anonymous.get(response.data['next'])
+        self.assertEqual(sorted(ids), sorted(r.id for r in self.recipes))
+
+    def test_tampered_cursor(self):
+        for position in (
+            ['notadate', 'x', 1],
+            [None, None, None],
+            [1, 2, 3],
+            ['2024-01-01T00:00:00+00:00', 'x', 'y'],
+            [[], {}, []],
+            [1, 2],
+        ):
+            with self.subTest(position=position):
+                response = self.anonymous.get(
+                    '/api/recipes/', {'cursor': self.encode(position)}
+                )
+                self.assertEqual(response.status_code, 404)
+        response = self.anonymous.get('/api/recipes/', {'cursor': '%%%'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeMultipartTest(RecipeAPITestCase):
+    """Создание рецепта из формы multipart с фото файлом."""
+
+    def post(self, tags, name='Рецепт из формы'):
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        return self.client.post('/api/recipes/', {
+            'name': name,
+            'text': '[Совет] жарить',
+            'cooking_time': 5,
+            'image': SimpleUploadedFile(
+                'image.png', buffer.getvalue(), 'image/png'
+            ),
+            'tags': tags,
+            'ingredients': json.dumps(
+                [{'id': self.ingredients[0].id, 'amount': 2}]
+            ),
+        }, format='multipart')
+
+    def test_tags_forms(self):
+        first, second = self.tags[0].id, self.tags[1].id
+        for index, (tags, expected) in enumerate((
+            ([first], [first]),
+            ([first, second], [first, second]),
+            (json.dumps([first, second]), [first, second]),
+        )):
+            with self.subTest(tags=tags):
+                response = self.post(tags, name=f'Рецепт из формы {index}')
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(
+                    sorted(tag['id'] for tag in response.data['tags']),
+                    expected
+                )
+                self.assertEqual(response.data['text'], '[Совет] жарить')
+
+    def test_invalid_json(self):
+        response = self.post('[1')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,106 @@
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.db import connections
+
+current_timing = ContextVar('current_timing', default=None)
+
+
+def get_view_label(request):
+    """Метка вида `recipes.list` для вьюсетов DRF, иначе имя маршрута."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    basename = getattr(view, 'initkwargs', {}).get('basename')
+    actions = getattr(view, 'actions', None)
+    if basename and actions:
+        return f'{basename}.{actions.get(request.method.lower(), "unknown")}'
+    return match.view_name or match._func_path
+
+
+def wrap_queries(wrapper):
+    """Подключает execute_wrapper ко всем настроенным базам."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+    return stack
+
+
+class RequestTiming:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.spans = {'sql': 0.0}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('sql', start)
+
+    def add(self, name, start):
+        self.spans[name] = (
+            self.spans.get(name, 0.0) + time.perf_counter() - start
+        )
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start)
+
+    def finish(self):
+        self.add('total', self.start)
+
+    def header(self):
+        metrics = []
+        for name, duration in self.spans.items():
+            metric = f'{name};dur={duration * 1000:.1f}'
+            if name == 'sql':
+                metric += f';desc="{self.queries} queries"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def log_fields(self):
+        fields = {'queries': self.queries}
+        fields.update(
+            (f'{name}_ms', round(duration * 1000, 1))
+            for name, duration in self.spans.items()
+        )
+        return fields
+
+
+def span(name):
+    """Именованный отрезок времени внутри замеряемого запроса."""
+    timing = current_timing.get()
+    if timing is None:
+        return nullcontext()
+    return timing.span(name)
+
+
+def timed(name, iterable):
+    """Учитывает время генерации частей потокового ответа."""
+    timing = current_timing.get()
+    if timing is None:
+        return iterable
+    return timed_chunks(timing, name, iterable)
+
+
+def timed_chunks(timing, name, iterable):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timing.add(name, start)
+        yield chunk
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Rejects uploads larger than MAX_UPLOAD_SIZE while streaming"""
+
+    def get_error(self):
+        return MultiPartParserError(
+            'Размер загружаемого файла превышает '
+            f'{settings.MAX_UPLOAD_SIZE // (1024 * 1024)} МБ.'
+        )
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > settings.MAX_UPLOAD_SIZE + 64 * 1024:
+            raise self.get_error()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.MAX_UPLOAD_SIZE:
+            raise self.get_error()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
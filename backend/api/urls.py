@@ -6,7 +6,8 @@ from .views import (
     TagViewSet,
     IngredientViewSet,
     RecipeViewSet,
-    UserViewSet
+    UserViewSet,
+    MetricsView
 )
 
 router = DefaultRouter()
@@ -16,6 +17,7 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('users', UserViewSet, basename='users')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
     path(
@@ -1,9 +1,41 @@
+import csv
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value
+)
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
+from recipes.models import (
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingListItem
+)
+from users.models import Follow
+
 from .exceptions import BadRequestException
 
+User = get_user_model()
+
+SHOPPING_CART_CHUNK_SIZE = 2000
+
+shopping_list_batch = ContextVar('shopping_list_batch', default=None)
+
 
 def get_object_or_400(error_text, model, **data):
     try:
@@ -68,13 +100,228 @@ def add_delete_to(request, pk, model, obj_field_name, obj_not_exist_text,
     return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
-def list_related_recipes(self, queryset, value,
-                         relation_model, related_name):
-    user = self.request.user.id
-    if bool(value):
-        return queryset.filter(
-            id__in=relation_model.objects.filter(
-                user=user).values('recipe_id')).order_by(
-                    '__'.join([related_name, 'created_at'])
+def list_related_recipes(self, queryset, value, related_name):
+    user = self.request.user
+    if not bool(value):
+        return queryset
+    if not user.is_authenticated:
+        # Фильтр по user=None превратился бы в LEFT JOIN ... IS NULL.
+        return queryset.none()
+    return queryset.filter(
+        **{'__'.join([related_name, 'user']): user}
+    ).order_by('__'.join([related_name, 'created_at']))
+
+
+def annotate_subscribed(queryset, user):
+    if not user.is_authenticated:
+        return queryset.annotate(is_subscribed=Value(False))
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Follow.objects
+            .filter(user=user, author=OuterRef('pk'))
+        )
+    )
+
+
+def annotate_recipes_count(queryset):
+    recipes_count = (
+        Recipe.objects
+        .filter(author=OuterRef('pk'))
+        .order_by()
+        .values('author')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return queryset.annotate(
+        recipes_count=Coalesce(
+            Subquery(recipes_count, output_field=IntegerField()), 0
+        )
+    )
+
+
+class Echo:
+    """Pseudo-buffer that hands csv.writer rows back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_changes(users, old_contents=(), new_contents=()):
+    changes = defaultdict(int)
+    old_contents, new_contents = list(old_contents), list(new_contents)
+    for user_id in users:
+        for ingredient_id, amount in old_contents:
+            changes[user_id, ingredient_id] -= amount
+        for ingredient_id, amount in new_contents:
+            changes[user_id, ingredient_id] += amount
+    return changes
+
+
+def update_shopping_list(changes):
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    user_ids = {user_id for user_id, _ in changes}
+    # Блокировка строк позиций не защищает от двух параллельных вставок
+    # одного нового ингредиента, поэтому изменения списков одного
+    # пользователя упорядочены блокировкой его строки. NO KEY UPDATE не
+    # конфликтует с блокировкой внешнего ключа при вставке в корзину.
+    list(
+        User.objects.select_for_update(no_key=True)
+        .filter(id__in=user_ids).order_by('id').values_list('id', flat=True)
+    )
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=user_ids,
+            ingredient_id__in={ingredient_id for _, ingredient_id in changes}
+        )
+    }
+    new_items, changed_items, empty_items = [], [], []
+    for (user_id, ingredient_id), delta in changes.items():
+        item = items.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                new_items.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=delta
+                ))
+            continue
+        item.total_amount += delta
+        if item.total_amount > 0:
+            changed_items.append(item)
+        else:
+            empty_items.append(item.pk)
+    ShoppingListItem.objects.bulk_create(new_items)
+    ShoppingListItem.objects.bulk_update(changed_items, ('total_amount',))
+    ShoppingListItem.objects.filter(pk__in=empty_items).delete()
+
+
+def change_shopping_list(relation, added):
+    """Учитывает добавление или удаление рецепта из корзины.
+
+    Внутри batch_shopping_list_changes изменения копятся и применяются
+    одним проходом, а состав каждого рецепта читается один раз.
+    """
+    batch = shopping_list_batch.get()
+    contents = None if batch is None else batch['contents'].get(
+        relation.recipe_id
+    )
+    if contents is None:
+        contents = list(
+            RecipeIngredient.objects.filter(recipe_id=relation.recipe_id)
+            .values_list('ingredient_id', 'amount')
         )
-    return queryset
+    if added:
+        changes = shopping_list_changes([relation.user_id],
+                                        new_contents=contents)
+    else:
+        changes = shopping_list_changes([relation.user_id],
+                                        old_contents=contents)
+    if batch is None:
+        with transaction.atomic(savepoint=False):
+            update_shopping_list(changes)
+        return
+    batch['contents'][relation.recipe_id] = contents
+    for key, delta in changes.items():
+        batch['changes'][key] += delta
+
+
+@contextmanager
+def batch_shopping_list_changes():
+    """Копит изменения списков покупок, например при каскадном удалении."""
+    batch = {'changes': defaultdict(int), 'contents': {}}
+    token = shopping_list_batch.set(batch)
+    try:
+        yield
+    finally:
+        shopping_list_batch.reset(token)
+    update_shopping_list(batch['changes'])
+
+
+def aggregate_shopping_list():
+    return (
+        ShoppingCart.objects
+        .filter(recipe__contents__isnull=False)
+        .order_by()
+        .values('user_id', 'recipe__contents__ingredient_id')
+        .annotate(total_amount=Sum('recipe__contents__amount'))
+    )
+
+
+def get_shopping_cart(user):
+    recipe_names = (
+        ShoppingCart.objects
+        .filter(user=user)
+        .values_list('recipe__name', flat=True)
+        .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+    )
+    ingredients = (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name')
+        .values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'total_amount'
+        )
+        .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+    )
+    return recipe_names, ingredients
+
+
+def shopping_cart_txt(user):
+    recipe_names, ingredients = get_shopping_cart(user)
+    yield 'Вы выбрали следующие рецепты:\n'
+    for number, name in enumerate(recipe_names):
+        yield name if not number else ', ' + name
+    yield '.\n\nСписок покупок:\n'
+    for number, position in enumerate(ingredients):
+        line = '{} - {} {}'.format(
+            position['ingredient__name'],
+            position['total_amount'],
+            position['ingredient__measurement_unit']
+        )
+        yield line if not number else ';\n' + line
+    yield '.'
+
+
+def shopping_cart_csv(user):
+    _, ingredients = get_shopping_cart(user)
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    for position in ingredients:
+        yield writer.writerow((
+            position['ingredient__name'],
+            position['total_amount'],
+            position['ingredient__measurement_unit']
+        ))
+
+
+def shopping_cart_json(user):
+    recipe_names, ingredients = get_shopping_cart(user)
+    yield '{"recipes": ['
+    for number, name in enumerate(recipe_names):
+        yield json.dumps(name, ensure_ascii=False) if not number else (
+            ', ' + json.dumps(name, ensure_ascii=False)
+        )
+    yield '], "ingredients": ['
+    for number, position in enumerate(ingredients):
+        item = json.dumps(
+            {
+                'name': position['ingredient__name'],
+                'measurement_unit': position['ingredient__measurement_unit'],
+                'amount': position['total_amount']
+            },
+            ensure_ascii=False
+        )
+        yield item if not number else ', ' + item
+    yield ']}'
+
+
+SHOPPING_CART_WRITERS = {
+    'txt': shopping_cart_txt,
+    'csv': shopping_cart_csv,
+    'json': shopping_cart_json,
+}
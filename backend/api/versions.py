@@ -0,0 +1,64 @@
+import time
+import uuid
+
+from django.core.cache import caches
+
+# Версии и отметки времени хранятся отдельно от вытесняемых данных:
+# потерянная отметка времени сделала бы старый ETag снова верным.
+cache = caches['versions']
+
+
+def get_version_key(model):
+    return f'table_version:{model._meta.label_lower}'
+
+
+def get_table_version(model):
+    key = get_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_table_version(model):
+    cache.set_many(
+        {
+            get_version_key(model): uuid.uuid4().hex,
+            get_changed_at_key(model): time.time(),
+        },
+        timeout=None
+    )
+
+
+def get_changed_at_key(model):
+    return f'table_changed_at:{model._meta.label_lower}'
+
+
+def get_timestamp(key):
+    """Отметка времени; пропавшая из кэша считается изменением сейчас."""
+    timestamp = cache.get(key)
+    if timestamp is None:
+        cache.add(key, time.time(), timeout=None)
+        timestamp = cache.get(key)
+    return timestamp
+
+
+def get_table_changed_at(model):
+    return get_timestamp(get_changed_at_key(model))
+
+
+def get_user_state_key(user_id):
+    return f'user_state_changed_at:{user_id}'
+
+
+def get_user_state_changed_at(user_id):
+    return get_timestamp(get_user_state_key(user_id))
+
+
+def touch_user_state(user_id):
+    cache.set(get_user_state_key(user_id), time.time(), timeout=None)
+
+
+def forget_user_state(user_id):
+    cache.delete(get_user_state_key(user_id))
@@ -1,12 +1,25 @@
-from django.http import HttpResponse
+import hashlib
+import json
+
+from django.http import StreamingHttpResponse
 from django.contrib.auth import get_user_model
-from django.db.models import Sum, Count
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as BaseUserViewSet
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
 from rest_framework import status
 
 from api.viewsets import ReadCreateDeleteModelViewSet
@@ -19,11 +32,15 @@ from recipes.models import (
     RecipeIngredient
 )
 from users.models import Follow
+
+from .feed import get_cached_feed, get_feed_key
 from .filters import (
     RecipeFilter,
     IngredientFilter,
     UserRecipeFilter
 )
+from .indexes import ingredient_index
+from .metrics import metrics
 from .serializers import (
     TagSerializer,
     IngredientSerializer,
@@ -31,8 +48,24 @@ from .serializers import (
     CreateRecipeSerializer,
     SubscriptionsSerializer
 )
+from .paginations import RecipePagination
+from .parsers import MultiPartJSONParser
 from .permissions import IsAdminOrReadOnly, IsOwner
-from .utils import add_delete_to
+from .renderers import CSVRenderer, PlainTextRenderer
+from .representations import get_recipe_representations
+from .timing import span, timed
+from .utils import (
+    SHOPPING_CART_WRITERS,
+    add_delete_to,
+    annotate_recipes_count,
+    annotate_subscribed,
+    batch_shopping_list_changes
+)
+from .versions import (
+    get_table_changed_at,
+    get_table_version,
+    get_user_state_changed_at
+)
 
 User = get_user_model()
 
@@ -48,26 +81,186 @@ class IngredientViewSet(ReadCreateDeleteModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(name))
+
 
 class RecipeViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (IsOwner | IsAdminOrReadOnly,)
+    pagination_class = RecipePagination
+    parser_classes = (JSONParser, MultiPartJSONParser)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_prefetches(self):
+        return (
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'contents',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            Prefetch(
+                'author',
+                queryset=annotate_subscribed(
+                    User.objects.all(), self.request.user
+                )
+            )
+        )
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            # Для list и retrieve связанные объекты подгружаются только
+            # для рецептов, которых нет в кэше представлений.
+            queryset = queryset.prefetch_related(*self.get_prefetches())
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False)
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                RecipeFavorite.objects
+                .filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects
+                .filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_author_subscribed=Exists(
+                Follow.objects
+                .filter(user=user, author=OuterRef('author'))
+            )
+        )
+
+    def get_representations(self, recipes):
+        return get_recipe_representations(
+            recipes,
+            lambda missing: self.get_serializer(missing, many=True).data,
+            self.get_prefetches()
+        )
+
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update', 'update'):
             return CreateRecipeSerializer
         return super().get_serializer_class()
 
+    def list(self, request, *args, **kwargs):
+        key = get_feed_key(request)
+        if key is None:
+            return self.get_conditional_response(
+                self.get_list_validators(), self.get_list_response
+            )
+        # Валидаторы кэшируемой ленты берутся из самой записи кэша, без
+        # агрегирующего запроса по отфильтрованным рецептам.
+        entry = get_cached_feed(key, lambda: self.get_list_response().data)
+        return self.get_conditional_response(
+            (self.get_etag(key, entry['generation']), entry['changed_at']),
+            lambda: Response(entry['data'])
+        )
+
+    def get_list_response(self):
+        with span('filter'):
+            queryset = self.filter_queryset(self.get_queryset())
+        with span('paginate'):
+            page = self.paginate_queryset(queryset)
+        with span('serialize'):
+            data = self.get_representations(
+                list(queryset) if page is None else page
+            )
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            self.get_detail_validators(), self.get_detail_response
+        )
+
+    def get_detail_response(self):
+        instance = self.get_object()
+        with span('serialize'):
+            data, = self.get_representations([instance])
+        return Response(data)
+
+    def get_changed_at(self, *timestamps):
+        """Время последнего изменения, влияющего на ответ."""
+        timestamps += tuple(
+            get_table_changed_at(model) for model in (Tag, Ingredient)
+        )
+        if self.request.user.is_authenticated:
+            timestamps += (get_user_state_changed_at(self.request.user.id),)
+        return max(timestamps)
+
+    def get_etag(self, *parts):
+        content = json.dumps([
+            self.request.user.id,
+            self.request.accepted_renderer.format,
+            *parts
+        ], default=str)
+        return quote_etag(hashlib.sha1(content.encode()).hexdigest())
+
+    def get_list_validators(self):
+        # Любое изменение рецепта сдвигает версию и отметку времени
+        # таблицы Recipe, поэтому сканировать выборку не нужно.
+        changed_at = self.get_changed_at(get_table_changed_at(Recipe))
+        return self.get_etag(
+            sorted(self.request.query_params.lists()),
+            get_table_version(Recipe),
+            changed_at
+        ), changed_at
+
+    def get_detail_validators(self):
+        try:
+            with span('conditional'):
+                updated_at = Recipe.objects.filter(
+                    pk=self.kwargs['pk']
+                ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            return None
+        if updated_at is None:
+            return None
+        changed_at = self.get_changed_at(updated_at.timestamp())
+        return self.get_etag(self.kwargs['pk'], changed_at), changed_at
+
+    def get_conditional_response(self, validators, build):
+        """Ответ 304 по ETag и Last-Modified без сериализации рецептов."""
+        if validators is None:
+            return build()
+        etag, changed_at = validators
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=int(changed_at)
+        )
+        if response is None:
+            response = build()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(changed_at)
+        if self.request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with batch_shopping_list_changes():
+            instance.delete()
+
     @action(detail=True, methods=['post', 'delete'],
             url_path='favorite',
             permission_classes=[IsAuthenticated])
@@ -94,44 +287,20 @@ class RecipeViewSet(ModelViewSet):
 
     @action(detail=False, methods=['get'],
             url_path='download_shopping_cart',
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer])
     def download_shopping_cart(self, request):
-        user = request.user.id
-        recipes = ShoppingCart.objects.filter(user=user).values(
-            'recipe_id', 'recipe__name')
-        order_data = (
-            RecipeIngredient.objects
-            .filter(recipe_id__in=recipes.values('recipe_id'))
-            .select_related('ingredient')
-            .order_by('ingredient__name')
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
-        ordered_recipes = ', '.join(
-            [
-                '{}'.format(recipe['recipe__name']) for recipe in recipes
-            ]
-        )
-        ingredients = ';\n'.join(
-            [
-                '{} - {} {}'.format(
-                    position['ingredient__name'],
-                    position['total_amount'],
-                    position['ingredient__measurement_unit'])
-                for position in order_data
-            ]
-        )
-        file_data = '\n'.join(
-            ['Вы выбрали следующие рецепты:',
-             f'{ordered_recipes}.\n',
-             'Список покупок:',
-             f'{ingredients}.']
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            timed(
+                'shopping_cart',
+                SHOPPING_CART_WRITERS[renderer.format](request.user)
+            ),
+            content_type=f'{renderer.media_type}; charset=utf-8'
         )
-        response = HttpResponse(
-            file_data,
-            content_type='text/plain'
+        response['Content-Disposition'] = (
+            f'attachment;filename=file.{renderer.format}'
         )
-        response['Content-Disposition'] = 'attachment;filename=file.txt'
         return response
 
 
@@ -140,17 +309,27 @@ class UserViewSet(BaseUserViewSet):
 
     def get_queryset(self):
         if self.action in ('subscriptions'):
-            return (
+            queryset = annotate_recipes_count(
                 User.objects
                 .filter(following__user=self.request.user)
             )
-        return super(UserViewSet, self).get_queryset()
+        else:
+            queryset = super(UserViewSet, self).get_queryset()
+        if self.action == 'subscribe':
+            # Подписка меняется в этом же запросе, флаг считается заново.
+            return annotate_recipes_count(queryset)
+        return annotate_subscribed(queryset, self.request.user)
 
     def filter_queryset(self, queryset):
         if self.action in ('subscriptions', 'subscribe'):
             self.filterset_class = UserRecipeFilter
         return super().filter_queryset(queryset)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        with batch_shopping_list_changes():
+            super().perform_destroy(instance)
+
     def get_permissions(self):
         if self.action == 'me':
             permission_classes = [IsAuthenticated]
@@ -160,11 +339,9 @@ class UserViewSet(BaseUserViewSet):
     @action(detail=False, methods=['get'], url_path='subscriptions',
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        queryset = self.filter_queryset(self.get_queryset())
         queryset = (
-            queryset
-            .annotate(recipes_count=Count('recipes'))
-            .order_by('follower__created_at')
+            self.filter_queryset(self.get_queryset())
+            .order_by('following__created_at')
         )
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -192,3 +369,11 @@ class UserViewSet(BaseUserViewSet):
             'Пользователь не был добавлен в подписки!',
             Follow, SubscriptionsSerializer, False
         )
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request):
+        return Response(metrics.render())
@@ -1,7 +1,15 @@
+import hashlib
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from rest_framework import mixins
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
+from .versions import get_table_version
+
 
 class ReadCreateDeleteModelViewSet(mixins.ListModelMixin,
                                    mixins.RetrieveModelMixin,
@@ -10,3 +18,30 @@ class ReadCreateDeleteModelViewSet(mixins.ListModelMixin,
     http_method_names = ['get']
     permission_classes = (AllowAny,)
     pagination_class = None
+    _payloads = {}
+
+    def get_payload(self):
+        model = self.queryset.model
+        version = get_table_version(model)
+        payload = self._payloads.get(model)
+        if payload is None or payload[0] != version:
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            content = JSONRenderer().render(serializer.data)
+            etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+            payload = (version, content, etag)
+            self._payloads[model] = payload
+        return payload
+
+    def list(self, request, *args, **kwargs):
+        params = set(request.query_params) - {
+            api_settings.URL_FORMAT_OVERRIDE
+        }
+        if params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        _, content, etag = self.get_payload()
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
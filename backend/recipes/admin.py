@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Prefetch
 from django.utils.html import format_html
 
 from recipes.models import (
@@ -8,7 +9,8 @@ from recipes.models import (
     Recipe,
     RecipeIngredient,
     RecipeFavorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListItem
 )
 
 User = get_user_model()
@@ -39,6 +41,7 @@ class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 0
     min_num = 1
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Recipe)
@@ -54,17 +57,24 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ['name']
     empty_value_display = '-пусто-'
     date_hierarchy = 'pub_date'
+    list_select_related = ('author',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch(
+                'contents',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        ).annotate(favorited_count=Count('favorited'))
 
     @admin.display(description='Ингредиенты')
     def get_ingredients(self, obj):
-        ingr_set = obj.ingredients.all()
-        ri_set = RecipeIngredient.objects.filter(recipe=obj)
-        data = [ri_set.get(ingredient=ingr).__str__() for ingr in ingr_set]
+        data = [str(content) for content in obj.contents.all()]
         return format_html('<br/>'.join(data))
 
-    @admin.display(description='Избран')
+    @admin.display(description='Избран', ordering='favorited_count')
     def get_favorited_count(self, obj):
-        return obj.favorited.all().count()
+        return obj.favorited_count
 
 
 @admin.register(RecipeFavorite)
@@ -76,6 +86,7 @@ class RecipeFavoriteAdmin(admin.ModelAdmin):
     list_filter = ('user', )
     search_fields = ['user']
     empty_value_display = '-пусто-'
+    list_select_related = ('user', 'recipe')
 
 
 @admin.register(ShoppingCart)
@@ -87,3 +98,16 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user', )
     search_fields = ['user']
     empty_value_display = '-пусто-'
+    list_select_related = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """ShoppingListItem information"""
+
+    list_display = ('user', 'ingredient', 'total_amount')
+    list_display_links = ('user', )
+    list_filter = ('user', )
+    search_fields = ['user']
+    empty_value_display = '-пусто-'
+    list_select_related = ('user', 'ingredient')
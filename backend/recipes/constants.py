@@ -1,3 +1,13 @@
 MAX_TEXT_LENGTH = 20
 MAX_NAME_LENGTH = 200
 MAX_COLOR_LENGTH = 7
+IMAGE_VARIANTS = (
+    ('card', 360),
+    ('detail', 720),
+    ('retina', 1440),
+)
+IMAGE_FORMATS = (
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+)
+IMAGE_QUALITY = 80
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api.versions import bump_table_version
+from recipes.constants import IMAGE_FORMATS, IMAGE_QUALITY, IMAGE_VARIANTS
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+
+def get_placeholder(image):
+    red, green, blue = (
+        image.convert('RGB')
+        .resize((1, 1), Image.Resampling.BOX)
+        .getpixel((0, 0))
+    )
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def save_variant(image, name, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A')
+                         if 'A' in image.getbands() else None)
+        image = background
+    image.save(buffer, image_format, quality=IMAGE_QUALITY, optimize=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def get_stored_image(file, extension):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    file.name = f'{digest.hexdigest()}.{extension}'
+    name = Recipe._meta.get_field('image').generate_filename(None, file.name)
+    if default_storage.exists(name) and touch_stored_file(name):
+        return name
+    return file
+
+
+def touch_stored_file(name):
+    """Обновляет время изменения файла, который используется повторно.
+
+    Иначе cleanup_images может счесть старый файл без ссылок мусором и
+    удалить его до коммита рецепта, который на него сошлётся.
+    """
+    try:
+        os.utime(default_storage.path(name))
+    except NotImplementedError:
+        pass
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def is_image_referenced(name):
+    return Recipe.objects.filter(
+        Q(image=name) | Q(image_variants__icontains=name)
+    ).exists()
+
+
+def get_referenced_images():
+    referenced = set()
+    recipes = Recipe.objects.exclude(image='').values_list(
+        'image', 'image_variants'
+    )
+    for image, variants in recipes.iterator():
+        referenced.add(image)
+        for variant in variants.values():
+            referenced.update(
+                variant[extension] for extension, _ in IMAGE_FORMATS
+                if variant.get(extension)
+            )
+    return referenced
+
+
+def process_recipe_image(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    stem = PurePosixPath(recipe.image.name).stem
+    variants = {}
+    for variant, width in IMAGE_VARIANTS:
+        if image.width <= width and variants:
+            variants[variant] = variants[next(reversed(variants))]
+            continue
+        resized = image
+        if image.width > width:
+            resized = image.resize(
+                (width, round(image.height * width / image.width)),
+                Image.Resampling.LANCZOS
+            )
+        variants[variant] = {'width': resized.width}
+        for extension, image_format in IMAGE_FORMATS:
+            name = f'recipes_images/variants/{stem}_{variant}.{extension}'
+            if not (default_storage.exists(name)
+                    and touch_stored_file(name)):
+                name = save_variant(resized, name, image_format)
+            variants[variant][extension] = name
+    updated = Recipe.objects.filter(
+        id=recipe_id, image=recipe.image.name
+    ).update(
+        image_width=image.width,
+        image_height=image.height,
+        image_placeholder=get_placeholder(image),
+        image_variants=variants,
+        updated_at=timezone.now()
+    )
+    if updated:
+        bump_table_version(Recipe)
+
+
+def run_image_processing(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id):
+    transaction.on_commit(
+        lambda: executor.submit(run_image_processing, recipe_id)
+    )
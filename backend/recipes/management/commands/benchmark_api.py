@@ -0,0 +1,547 @@
+import base64
+import json
+import math
+import os
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.filters import IngredientFilter
+from api.indexes import ingredient_index
+from api.utils import shopping_list_changes, update_shopping_list
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+
+User = get_user_model()
+
+ITERATIONS = 20
+WARMUP = 2
+PAGE_SIZES = (6, 60)
+THRESHOLD = 0.25
+CART_SIZE = 5000
+SCENARIOS = ('shopping_cart', 'autocomplete', 'writes', 'upload')
+UPLOAD_SIZE = 10 * 1024 * 1024
+AUTOCOMPLETE_SAMPLES = 10
+RECIPE_SIZES = (5, 50, 200)
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    return values[max(math.ceil(rank * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Замер числа запросов и времени ответа эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=ITERATIONS
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=WARMUP
+        )
+        parser.add_argument(
+            '--page-sizes',
+            default=','.join(map(str, PAGE_SIZES)),
+            help='Размеры страниц через запятую для списков'
+        )
+        parser.add_argument(
+            '--email',
+            help='Пользователь, от имени которого выполняются запросы'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для отчёта в JSON, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Отчёт предыдущего запуска для сравнения'
+        )
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(SCENARIOS),
+            help='Дополнительные замеры через запятую, пусто - без них'
+        )
+        parser.add_argument(
+            '--cart-size',
+            type=int,
+            default=CART_SIZE,
+            help='Число рецептов в корзине для замера памяти выгрузки'
+        )
+        parser.add_argument(
+            '--upload-size',
+            type=int,
+            default=UPLOAD_SIZE,
+            help='Размер фото в байтах для замера загрузки'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=THRESHOLD,
+            help='Допустимый рост p50 относительно baseline'
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['email'])
+        page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        token, _ = Token.objects.get_or_create(user=user)
+        self.anon = APIClient(SERVER_NAME='localhost')
+        self.auth = APIClient(SERVER_NAME='localhost')
+        self.auth.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.iterations = options['iterations']
+        self.warmup = options['warmup']
+        endpoints = {}
+        self.failures = failures = []
+        for name, client, requests, paginated in self.get_endpoints(user):
+            if not paginated:
+                endpoints[name] = self.measure(client, requests)
+                continue
+            results = {}
+            for size in page_sizes:
+                results[size] = self.measure(client, [
+                    (method, self.with_limit(url, size))
+                    for method, url in requests
+                ])
+                endpoints[f'{name}[limit={size}]'] = results[size]
+            counts = {result['queries'] for result in results.values()}
+            if len(counts) > 1:
+                failures.append(
+                    f'{name}: число запросов растёт с размером страницы '
+                    f'{sorted(counts)}'
+                )
+        report = {
+            'vendor': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'tags': Tag.objects.count(),
+                'followed_authors': user.follower.count(),
+            },
+            'iterations': self.iterations,
+            'endpoints': endpoints,
+            'scenarios': {
+                name: getattr(self, f'measure_{name}')(user, options)
+                for name in filter(None, options['scenarios'].split(','))
+            },
+        }
+        if options['baseline']:
+            failures += self.compare(
+                endpoints, options['baseline'], options['threshold']
+            )
+        report['failures'] = failures
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            Path(options['output']).write_text(output, encoding='utf-8')
+        else:
+            self.stdout.write(output)
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                follows=Count('follower')
+            ).order_by('-follows', 'id').first()
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        return user
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError('Нет данных: заполните базу перед замером.')
+        author = User.objects.exclude(id=user.id).exclude(
+            following__user=user
+        ).first()
+        free_recipe = Recipe.objects.exclude(favorited__user=user).exclude(
+            buyers__user=user
+        ).first()
+        endpoints = [
+            ('tags.list', self.anon, [('get', '/api/tags/')], False),
+            ('tags.retrieve', self.anon,
+             [('get', f'/api/tags/{tag.id}/')], False),
+            ('ingredients.list', self.anon,
+             [('get', '/api/ingredients/')], False),
+            ('ingredients.search', self.anon,
+             [('get', f'/api/ingredients/?name={ingredient.name[:2]}')],
+             False),
+            ('ingredients.retrieve', self.anon,
+             [('get', f'/api/ingredients/{ingredient.id}/')], False),
+            ('recipes.list.anon', self.anon,
+             [('get', '/api/recipes/')], True),
+            ('recipes.list', self.auth, [('get', '/api/recipes/')], True),
+            ('recipes.list.tags', self.auth,
+             [('get', f'/api/recipes/?tags={tag.slug}')], True),
+            ('recipes.list.favorited', self.auth,
+             [('get', '/api/recipes/?is_favorited=1')], True),
+            ('recipes.list.cursor', self.auth,
+             [('get', '/api/recipes/?cursor=')], True),
+            ('recipes.retrieve', self.auth,
+             [('get', f'/api/recipes/{recipe.id}/')], False),
+            ('recipes.download_shopping_cart', self.auth,
+             [('get', '/api/recipes/download_shopping_cart/')], False),
+            ('users.list', self.auth, [('get', '/api/users/')], True),
+            ('users.retrieve', self.auth,
+             [('get', f'/api/users/{recipe.author_id}/')], False),
+            ('users.me', self.auth, [('get', '/api/users/me/')], False),
+            ('users.subscriptions', self.auth,
+             [('get', '/api/users/subscriptions/')], True),
+            ('users.subscriptions.recipes_limit', self.auth,
+             [('get', '/api/users/subscriptions/?recipes_limit=3')], True),
+        ]
+        if free_recipe is not None:
+            for action in ('favorite', 'shopping_cart'):
+                url = f'/api/recipes/{free_recipe.id}/{action}/'
+                endpoints.append((
+                    f'recipes.{action}', self.auth,
+                    [('post', url), ('delete', url)], False
+                ))
+        if author is not None:
+            url = f'/api/users/{author.id}/subscribe/'
+            endpoints.append((
+                'users.subscribe', self.auth,
+                [('post', url), ('delete', url)], False
+            ))
+        return endpoints
+
+    def with_limit(self, url, size):
+        separator = '&' if '?' in url else '?'
+        return f'{url}{separator}limit={size}'
+
+    def measure(self, client, requests):
+        """Замер пачки запросов: создание и удаление считаются вместе."""
+        for _ in range(self.warmup):
+            for method, url in requests:
+                self.request(client, method, url)
+        timings = []
+        for _ in range(self.iterations):
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                for method, url in requests:
+                    status, size = self.request(client, method, url)
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'status': status,
+            'queries': len(queries),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'size_bytes': size,
+        }
+
+    def measure_memory(self, client, method, url, **kwargs):
+        """Пик памяти Python при отдаче ответа по частям и целиком."""
+        start = time.perf_counter()
+        self.request(client, method, url, **kwargs)
+        duration = (time.perf_counter() - start) * 1000
+        result = {'ms': round(duration, 3)}
+        for mode in ('streamed', 'buffered'):
+            tracemalloc.start()
+            try:
+                response = getattr(client, method)(url, **kwargs)
+                chunks = (
+                    response.streaming_content if response.streaming
+                    else [response.content]
+                )
+                if mode == 'streamed':
+                    for chunk in chunks:
+                        pass
+                else:
+                    content = b''.join(chunks)
+                    del content
+                result[f'peak_kb_{mode}'] = (
+                    tracemalloc.get_traced_memory()[1] // 1024
+                )
+            finally:
+                tracemalloc.stop()
+        return result
+
+    def measure_shopping_cart(self, user, options):
+        """Память выгрузки списка покупок для большой корзины.
+
+        Корзина пополняется внутри транзакции, которая затем
+        откатывается. buffered - пик при сборке всего файла в памяти,
+        как было до потоковой выгрузки.
+        """
+        with transaction.atomic():
+            recipe_ids = list(
+                Recipe.objects.exclude(buyers__user=user)
+                .values_list('id', flat=True)[:options['cart_size']]
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe_id=recipe_id)
+                for recipe_id in recipe_ids
+            )
+            update_shopping_list(shopping_list_changes(
+                [user.id],
+                new_contents=RecipeIngredient.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).values_list('ingredient_id', 'amount')
+            ))
+            result = {'cart_size': user.shopping_cart.count()}
+            for output_format in ('txt', 'csv', 'json'):
+                result[output_format] = self.measure_memory(
+                    self.auth, 'get',
+                    '/api/recipes/download_shopping_cart/'
+                    f'?format={output_format}'
+                )
+            transaction.set_rollback(True)
+        return result
+
+    def measure_autocomplete(self, user, options):
+        """Поиск ингредиентов по префиксу: индекс в памяти против ORM."""
+        names = list(
+            Ingredient.objects.order_by('id').values_list('name', flat=True)
+        )
+        step = max(len(names) // AUTOCOMPLETE_SAMPLES, 1)
+        prefixes = [
+            name[:length] for name in names[::step]
+            for length in (1, 2, 3)
+        ]
+        paths = {
+            'index': ingredient_index.search,
+            'orm': lambda prefix: list(
+                IngredientFilter(
+                    {'name': prefix}, queryset=Ingredient.objects.all()
+                ).qs.values('id', 'name', 'measurement_unit')
+            ),
+        }
+        result = {'prefixes': len(prefixes)}
+        for name, search in paths.items():
+            search(prefixes[0])
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(self.iterations):
+                    for prefix in prefixes:
+                        start = time.perf_counter()
+                        search(prefix)
+                        timings.append(
+                            (time.perf_counter() - start) * 1000
+                        )
+            result[name] = {
+                'queries_per_lookup': round(len(queries) / len(timings), 2),
+                'p50_ms': round(percentile(timings, 0.5), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+            }
+        return result
+
+    def get_recipe_payload(self, name, ingredient_ids, amount):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+        return {
+            'name': name,
+            'text': 'Замер записи рецепта',
+            'cooking_time': 10,
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id in ingredient_ids
+            ],
+        }
+
+    def measure_writes(self, user, options):
+        """Запросы и время создания, правки и удаления рецептов.
+
+        Правка заменяет половину ингредиентов и меняет количество
+        остальных. Всё выполняется в транзакции, которая откатывается.
+        """
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        sizes = sorted({
+            min(size, len(ingredient_ids) * 2 // 3) for size in RECIPE_SIZES
+        })
+        result = {}
+        with transaction.atomic():
+            for size in sizes:
+                timings = {'create': [], 'update': [], 'destroy': []}
+                counts = {}
+                for iteration in range(self.iterations):
+                    name = f'Замер записи {size} {iteration}'
+                    requests = (
+                        ('create', 'post', '/api/recipes/',
+                         self.get_recipe_payload(
+                             name, ingredient_ids[:size], 1
+                         )),
+                        ('update', 'patch', '/api/recipes/{id}/',
+                         self.get_recipe_payload(
+                             name,
+                             ingredient_ids[size // 2:size + size // 2],
+                             2
+                         )),
+                        ('destroy', 'delete', '/api/recipes/{id}/', None),
+                    )
+                    recipe_id = None
+                    for action, method, url, payload in requests:
+                        start = time.perf_counter()
+                        with CaptureQueriesContext(connection) as queries:
+                            response = getattr(self.auth, method)(
+                                url.format(id=recipe_id), payload,
+                                format='json'
+                            )
+                        timings[action].append(
+                            (time.perf_counter() - start) * 1000
+                        )
+                        if response.status_code >= 400:
+                            raise CommandError(
+                                f'{method.upper()} {url}: ответ '
+                                f'{response.status_code} {response.data}'
+                            )
+                        if action == 'create':
+                            recipe_id = response.data['id']
+                        counts[action] = len(queries)
+                result[f'ingredients={size}'] = {
+                    action: {
+                        'queries': counts[action],
+                        'p50_ms': round(percentile(values, 0.5), 3),
+                        'p99_ms': round(percentile(values, 0.99), 3),
+                    }
+                    for action, values in timings.items()
+                }
+            transaction.set_rollback(True)
+        for action in ('create', 'update', 'destroy'):
+            counts = {
+                size: result[f'ingredients={size}'][action]['queries']
+                for size in sizes
+            }
+            if len(set(counts.values())) > 1:
+                self.failures.append(
+                    f'writes.{action}: число запросов растёт с числом '
+                    f'ингредиентов {counts}'
+                )
+        return result
+
+    def measure_upload(self, user, options):
+        """Время и память создания рецепта с большим фото.
+
+        Фото передаётся файлом в multipart или строкой base64 в JSON.
+        Тело запроса собирается заранее, поэтому в пик памяти входят
+        только его копия в тестовом клиенте и разбор на сервере.
+        """
+        side = int(math.sqrt(options['upload_size'] / 3))
+        buffer = BytesIO()
+        Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3)
+        ).save(buffer, 'PNG', compress_level=0)
+        image = buffer.getvalue()
+        payload = self.get_recipe_payload(
+            'Замер загрузки фото',
+            Ingredient.objects.values_list('id', flat=True)[:5], 1
+        )
+        bodies = {
+            'multipart': (
+                encode_multipart(BOUNDARY, {
+                    **payload,
+                    'tags': json.dumps(payload['tags']),
+                    'ingredients': json.dumps(payload['ingredients']),
+                    'image': SimpleUploadedFile(
+                        'upload.png', image, 'image/png'
+                    ),
+                }),
+                MULTIPART_CONTENT
+            ),
+            'base64': (
+                json.dumps({
+                    **payload,
+                    'image': 'data:image/png;base64,'
+                    + base64.b64encode(image).decode(),
+                }).encode(),
+                'application/json'
+            ),
+        }
+        result = {'image_bytes': len(image)}
+        with transaction.atomic():
+            for mode, (body, content_type) in bodies.items():
+                timings = []
+                for iteration in range(self.iterations + 1):
+                    traced = iteration == self.iterations
+                    if traced:
+                        tracemalloc.start()
+                    start = time.perf_counter()
+                    try:
+                        response = self.auth.generic(
+                            'POST', '/api/recipes/', body, content_type
+                        )
+                        if traced:
+                            peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        if traced:
+                            tracemalloc.stop()
+                    if not traced:
+                        timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code >= 400:
+                        raise CommandError(
+                            f'POST /api/recipes/ ({mode}): ответ '
+                            f'{response.status_code} {response.data}'
+                        )
+                    recipe = Recipe.objects.get(id=response.data['id'])
+                    recipe.delete()
+                    default_storage.delete(recipe.image.name)
+                result[mode] = {
+                    'body_bytes': len(body),
+                    'p50_ms': round(percentile(timings, 0.5), 3),
+                    'p99_ms': round(percentile(timings, 0.99), 3),
+                    'peak_kb': peak // 1024,
+                }
+            transaction.set_rollback(True)
+        return result
+
+    def request(self, client, method, url, **kwargs):
+        response = getattr(client, method)(url, **kwargs)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {url}: ответ {response.status_code}'
+            )
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return response.status_code, len(content)
+
+    def compare(self, endpoints, path, threshold):
+        baseline = json.loads(Path(path).read_text(encoding='utf-8'))
+        failures = []
+        for name, result in endpoints.items():
+            previous = baseline['endpoints'].get(name)
+            if previous is None:
+                continue
+            if result['queries'] > previous['queries']:
+                failures.append(
+                    f'{name}: запросов {result["queries"]}, '
+                    f'в baseline {previous["queries"]}'
+                )
+            if result['p50_ms'] > previous['p50_ms'] * (1 + threshold):
+                failures.append(
+                    f'{name}: p50 {result["p50_ms"]} мс, '
+                    f'в baseline {previous["p50_ms"]} мс'
+                )
+        return failures
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import get_referenced_images, is_image_referenced
+
+IMAGE_DIRECTORIES = ('recipes_images', 'recipes_images/variants')
+
+
+class Command(BaseCommand):
+    help = 'Удаление файлов фото, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе указанного числа минут'
+        )
+
+    def handle(self, *args, **options):
+        referenced = get_referenced_images()
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        total = 0
+        for directory in IMAGE_DIRECTORIES:
+            if not default_storage.exists(directory):
+                continue
+            _, files = default_storage.listdir(directory)
+            for filename in files:
+                name = f'{directory}/{filename}'
+                if (name in referenced
+                        or default_storage.get_modified_time(name)
+                        > threshold):
+                    continue
+                # Набор ссылок собран в начале прохода: файл мог с тех пор
+                # понадобиться новому рецепту.
+                if is_image_referenced(name):
+                    continue
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                self.stdout.write(name)
+                total += 1
+        self.stdout.write(f'Удалено файлов: {total}')
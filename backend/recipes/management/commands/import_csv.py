@@ -1,45 +1,188 @@
 import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
 
+from django.apps import apps
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
 
-from recipes.models import Ingredient
-from api.serializers import IngredientSerializer
+from api.versions import bump_table_version
 
-User = get_user_model()
+BATCH_SIZE = 5000
 
 
 class Command(BaseCommand):
     help = 'Импорт CSV data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            default=['ingredients.csv'],
+            help='Файлы .csv или .json; относительные пути '
+                 'ищутся в CSV_FILES'
+        )
+        parser.add_argument(
+            '--model',
+            default='recipes.Ingredient',
+            help='Модель в формате app_label.ModelName'
+        )
+        parser.add_argument(
+            '--fields',
+            help='Поля через запятую в порядке столбцов CSV'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE
+        )
+
     def handle(self, *args, **options):
-        self.import_simple_csv(
-            'ingredients.csv',
-            Ingredient,
-            IngredientSerializer
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as error:
+            raise CommandError(error)
+        fields = self.get_fields(model, options['fields'])
+        unique_fields = self.get_unique_fields(model, fields)
+        for filename in options['files']:
+            path = Path(filename)
+            if not path.is_absolute() and not path.exists():
+                path = settings.CSV_FILES / filename
+            rows = self.validate(self.read_rows(path, fields), fields)
+            with transaction.atomic():
+                if connection.vendor == 'postgresql' and unique_fields:
+                    total = self.copy_rows(
+                        model, fields, unique_fields, rows,
+                        options['batch_size']
+                    )
+                else:
+                    total = self.bulk_create_rows(
+                        model, fields, unique_fields, rows,
+                        options['batch_size']
+                    )
+            bump_table_version(model)
+            self.stdout.write(f'{path.name}: импортировано {total} строк.')
+        self.stdout.write('Все файлы были успешно импрортированы.')
+
+    def get_fields(self, model, names):
+        if names:
+            return [model._meta.get_field(name) for name in names.split(',')]
+        return [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key and not field.is_relation
+        ]
+
+    def get_unique_fields(self, model, fields):
+        names = {field.name for field in fields}
+        candidates = [
+            constraint.fields for constraint in model._meta.constraints
+            if isinstance(constraint, models.UniqueConstraint)
+            and constraint.fields and not constraint.condition
+        ]
+        candidates += list(model._meta.unique_together)
+        candidates += [(field.name,) for field in fields if field.unique]
+        for candidate in candidates:
+            if set(candidate) <= names:
+                return [model._meta.get_field(name) for name in candidate]
+        return []
+
+    def read_rows(self, path, fields):
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.suffix == '.json':
+                for item in json.load(f):
+                    yield [item.get(field.name) for field in fields]
+                return
+            for row in csv.reader(f, delimiter=','):
+                yield row
+
+    def validate(self, rows, fields):
+        for line, row in enumerate(rows, start=1):
+            if len(row) != len(fields):
+                raise CommandError(
+                    f'Строка {line}: ожидалось {len(fields)} значений, '
+                    f'получено {len(row)}.'
+                )
+            try:
+                yield [
+                    field.clean(value, None)
+                    for field, value in zip(fields, row)
+                ]
+            except ValidationError as error:
+                raise CommandError(f'Строка {line}: {error.messages}')
+
+    def batches(self, rows, batch_size, fields, unique_fields):
+        key_indexes = [fields.index(field) for field in unique_fields]
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            if key_indexes:
+                batch = list({
+                    tuple(row[index] for index in key_indexes): row
+                    for row in batch
+                }.values())
+            yield batch
+
+    def bulk_create_rows(self, model, fields, unique_fields, rows,
+                         batch_size):
+        update_fields = [
+            field.name for field in fields if field not in unique_fields
+        ]
+        total = 0
+        for batch in self.batches(rows, batch_size, fields, unique_fields):
+            model.objects.bulk_create(
+                [
+                    model(**{
+                        field.attname: value
+                        for field, value in zip(fields, row)
+                    })
+                    for row in batch
+                ],
+                batch_size=batch_size,
+                update_conflicts=bool(unique_fields and update_fields),
+                ignore_conflicts=bool(unique_fields and not update_fields),
+                unique_fields=[field.name for field in unique_fields] or None,
+                update_fields=update_fields or None
+            )
+            total += len(batch)
+            self.stdout.write(f'Обработано строк: {total}')
+        return total
+
+    def copy_rows(self, model, fields, unique_fields, rows, batch_size):
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        staging = quote(f'{model._meta.db_table}_staging')
+        columns = ', '.join(quote(field.column) for field in fields)
+        keys = ', '.join(quote(field.column) for field in unique_fields)
+        updates = ', '.join(
+            f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+            for field in fields if field not in unique_fields
         )
-        print('Все файлы были успешно импрортированы.')
-
-    def import_simple_csv(self, filename, model, serializer=None):
-        csv_file = settings.CSV_FILES / filename
-
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            fieldnames = [
-                field.name for field in model._meta.get_fields()
-                if not field.is_relation
-            ]
-            reader = csv.reader(f, delimiter=',')
-            id = model.objects.all().count()
-            data = {}
-            for row in reader:
-                id += 1
-                data['id'] = id
-                data['name'], data['measurement_unit'] = row
-                model_instance = model()
-                for attr in fieldnames:
-                    setattr(model_instance, attr, data.get(attr))
-                if serializer:
-                    serializer_instance = serializer(data=data)
-                    serializer_instance.is_valid(raise_exception=True)
-                model_instance.save()
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {staging} ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            for batch in self.batches(rows, batch_size, fields, []):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+                total += len(batch)
+                self.stdout.write(f'Обработано строк: {total}')
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT DISTINCT ON ({keys}) {columns} FROM {staging} '
+                f'ON CONFLICT ({keys}) DO '
+                + (f'UPDATE SET {updates}' if updates else 'NOTHING')
+            )
+        return total
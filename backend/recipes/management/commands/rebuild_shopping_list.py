@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from api.utils import aggregate_shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу, не пересобирая её'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingListItem.objects.all().delete()
+                ShoppingListItem.objects.bulk_create(
+                    (
+                        ShoppingListItem(
+                            user_id=position['user_id'],
+                            ingredient_id=position[
+                                'recipe__contents__ingredient_id'
+                            ],
+                            total_amount=position['total_amount']
+                        )
+                        for position in aggregate_shopping_list().iterator()
+                    ),
+                    batch_size=1000
+                )
+        expected = {
+            (position['user_id'], position['recipe__contents__ingredient_id']):
+            position['total_amount']
+            for position in aggregate_shopping_list().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        }
+        mismatches = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        if mismatches:
+            raise CommandError(
+                f'Списки покупок расходятся в {len(mismatches)} позициях.'
+            )
+        self.stdout.write(
+            f'Списки покупок совпадают: {len(stored)} позиций.'
+        )
@@ -0,0 +1,289 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.versions import bump_table_version
+from recipes.images import get_stored_image
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeFavorite,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from users.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+PASSWORD = 'perf-password'
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'соус', 'запеканка', 'рагу', 'омлет',
+    'курица', 'говядина', 'рыба', 'грибы', 'сыр', 'томаты', 'картофель',
+    'морковь', 'лук', 'чеснок', 'перец', 'рис', 'гречка', 'тыква', 'яблоки',
+    'домашний', 'быстрый', 'пряный', 'сливочный', 'печёный', 'жареный',
+    'нарезать', 'обжарить', 'потушить', 'запечь', 'посолить', 'перемешать',
+    'довести', 'до', 'готовности', 'на', 'сковороде', 'в', 'духовке', 'с',
+)
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса: первые элементы выбираются чаще остальных."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=8,
+            help='Наибольшее число ингредиентов в рецепте'
+        )
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=3)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument(
+            '--followed-authors',
+            type=int,
+            default=0,
+            help='На скольких авторов подписан первый пользователь, '
+                 'для замера подписок'
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=16,
+            help='Число разных фото-заглушек'
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель закона Ципфа для популярности авторов и рецептов'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix',
+            default='perf',
+            help='Префикс логинов и названий создаваемых записей'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix.'
+            )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните import_csv.'
+            )
+        with transaction.atomic():
+            tag_ids = self.get_tag_ids()
+            images = self.create_images(options['images'])
+            user_ids = self.create_users(prefix, options['users'])
+            author_weights = zipf_weights(len(user_ids), options['skew'])
+            recipe_ids = self.create_recipes(
+                prefix, options['recipes'], user_ids, author_weights,
+                tag_ids, ingredient_ids, images,
+                options['ingredients_per_recipe']
+            )
+            recipe_weights = zipf_weights(len(recipe_ids), options['skew'])
+            self.create_links(
+                Follow, 'author_id', user_ids, user_ids, author_weights,
+                options['follows_per_user']
+            )
+            self.follow_authors(user_ids, options['followed_authors'])
+            self.create_links(
+                RecipeFavorite, 'recipe_id', user_ids, recipe_ids,
+                recipe_weights, options['favorites_per_user']
+            )
+            self.create_links(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                recipe_weights, options['carts_per_user']
+            )
+            call_command('rebuild_shopping_list', stdout=self.stdout)
+        # bulk_create не вызывает сигналы: сбрасываем ленту, ETag списков
+        # и кэшированные справочники вручную, как import_csv.
+        for model in (Tag, Recipe, Follow, RecipeFavorite, ShoppingCart):
+            bump_table_version(model)
+        self.stdout.write(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}.'
+        )
+
+    def get_tag_ids(self):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if tag_ids:
+            return tag_ids
+        return [
+            tag.id for tag in Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+        ]
+
+    def create_images(self, count):
+        images = []
+        for _ in range(count):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            width, height = 640, self.random.choice((360, 480, 640))
+            buffer = BytesIO()
+            Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+            file = get_stored_image(ContentFile(buffer.getvalue()), 'png')
+            if not isinstance(file, str):
+                file = default_storage.save(
+                    Recipe._meta.get_field('image').generate_filename(
+                        None, file.name
+                    ),
+                    file
+                )
+            images.append({
+                'image': file,
+                'image_width': width,
+                'image_height': height,
+                'image_placeholder': '#{:02x}{:02x}{:02x}'.format(*color),
+            })
+        return images
+
+    def create_users(self, prefix, count):
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}_{index}',
+                    email=f'{prefix}_{index}@example.com',
+                    first_name=f'Имя {index}',
+                    last_name=f'Фамилия {index}',
+                    password=password
+                )
+                for index in range(count)
+            ),
+            batch_size=self.batch_size
+        )
+        self.stdout.write(f'Пользователи: {len(users)}')
+        return [user.id for user in users]
+
+    def create_recipes(self, prefix, count, user_ids, author_weights,
+                       tag_ids, ingredient_ids, images, max_ingredients):
+        recipe_ids = []
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            authors = self.random.choices(
+                user_ids, cum_weights=author_weights, k=size
+            )
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=author_id,
+                    name=f'{prefix} {self.words(3)} {start + index}',
+                    text=self.words(self.random.randint(20, 80)),
+                    cooking_time=self.random.randint(5, 180),
+                    **self.random.choice(images)
+                )
+                for index, author_id in enumerate(authors)
+            )
+            RecipeIngredient.objects.bulk_create(
+                (
+                    RecipeIngredient(
+                        recipe_id=recipe.id,
+                        ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 500)
+                    )
+                    for recipe in recipes
+                    for ingredient_id in self.random.sample(
+                        ingredient_ids,
+                        min(
+                            self.random.randint(1, max_ingredients),
+                            len(ingredient_ids)
+                        )
+                    )
+                ),
+                batch_size=self.batch_size
+            )
+            Recipe.tags.through.objects.bulk_create(
+                (
+                    Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                    for recipe in recipes
+                    for tag_id in self.random.sample(
+                        tag_ids, self.random.randint(1, len(tag_ids))
+                    )
+                ),
+                batch_size=self.batch_size
+            )
+            recipe_ids += [recipe.id for recipe in recipes]
+            self.stdout.write(f'Рецепты: {len(recipe_ids)}')
+        return recipe_ids
+
+    def create_links(self, model, target_field, user_ids, target_ids,
+                     weights, per_user):
+        """Связи пользователей с популярными целями по закону Ципфа."""
+        batch = []
+        total = 0
+        for user_id in user_ids:
+            targets = set(self.random.choices(
+                target_ids, cum_weights=weights, k=per_user
+            ))
+            if model is Follow:
+                targets.discard(user_id)
+            batch += [
+                model(user_id=user_id, **{target_field: target_id})
+                for target_id in targets
+            ]
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+        total += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+
+    def follow_authors(self, user_ids, count):
+        """Первый пользователь подписывается на count других авторов."""
+        if not count:
+            return
+        user_id, authors = user_ids[0], user_ids[1:count + 1]
+        followed = set(
+            Follow.objects.filter(user_id=user_id)
+            .values_list('author_id', flat=True)
+        )
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in authors
+                if author_id not in followed
+            ),
+            batch_size=self.batch_size
+        )
+        self.stdout.write(f'Подписок первого пользователя: {len(authors)}')
+
+    def words(self, count):
+        return ' '.join(self.random.choices(WORDS, k=count))
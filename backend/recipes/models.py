@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.contrib.auth import get_user_model
@@ -67,6 +69,11 @@ class Recipe(models.Model):
         verbose_name='Автор'
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
     name = models.CharField(
         'Название',
         max_length=MAX_NAME_LENGTH
@@ -75,6 +82,26 @@ class Recipe(models.Model):
         'Фото',
         upload_to='recipes_images'
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина фото',
+        null=True,
+        blank=True
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота фото',
+        null=True,
+        blank=True
+    )
+    image_placeholder = models.CharField(
+        'Цвет-заглушка фото',
+        max_length=MAX_COLOR_LENGTH,
+        blank=True
+    )
+    image_variants = models.JSONField(
+        'Варианты фото',
+        default=dict,
+        blank=True
+    )
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -92,11 +119,22 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1, 'Время должно быть больше 0')],
         help_text='Введите время в минутах'
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date', 'name')
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            GinIndex(
+                fields=('search_vector',),
+                name='recipe_search_vector_idx'
+            )
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=('author', 'name'),
@@ -187,3 +225,34 @@ class ShoppingCart(models.Model):
                 name='unique_user_recipe_to_buy'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items'
+    )
+    total_amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        ordering = ('ingredient__name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return ('{} - {} {}'.format(
+            self.ingredient,
+            self.total_amount,
+            self.ingredient.measurement_unit)
+        )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.db.models import Prefetch
 from django.utils.html import format_html
 
 from .models import Follow
@@ -29,12 +30,18 @@ class FollowAdmin(admin.ModelAdmin):
     list_filter = ('user', )
     search_fields = ['user']
     empty_value_display = '-пусто-'
+    list_select_related = ('user', 'author')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch(
+                'user__follower',
+                queryset=Follow.objects.select_related('author')
+                .order_by('author__username')
+            )
+        )
 
     @admin.display(description='Подписки')
     def get_subs(self, obj):
-        subs = (
-            User.objects
-            .filter(following__user=obj.user)
-        )
-        data = [sub.first_name for sub in subs]
+        data = [follow.author.first_name for follow in obj.user.follower.all()]
         return format_html('<br/>'.join(data))